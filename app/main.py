@@ -1,38 +1,151 @@
 # app/main.py
 
-from fastapi import FastAPI, APIRouter
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
-from app.osm_recommend import OSMRecommender
-from transformers import AutoTokenizer, AutoModelForCausalLM
+import os
+
+# Split the CPU cores between the server worker processes (gunicorn -w WORKERS).
+# Thread pools read these variables when they are created, so they must be set
+# before torch, ONNX Runtime or llama.cpp are imported. Without this, every worker
+# spawns one thread per core and the workers fight over the CPU.
+# The CPUs this process may run on are used when available, so a CPU-limited
+# container is not split by the host's core count.
+WORKERS = max(1, int(os.environ.get("WORKERS", 1)))
+if hasattr(os, "sched_getaffinity"):
+    CPU_COUNT = len(os.sched_getaffinity(0))
+else:
+    CPU_COUNT = os.cpu_count() or 1
+NUM_THREADS = max(1, CPU_COUNT // WORKERS)
+os.environ.setdefault("OMP_NUM_THREADS", str(NUM_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(NUM_THREADS))
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
 import torch
 
-# Name of the local Llama model used for generating natural language responses.
-MODEL_NAME = "Qwen/Qwen2-1.5B-Instruct"
+torch.set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
+torch.set_num_interop_threads(1)
 
-# Create the FastAPI application.
-app = FastAPI(title="Restaurant Recommender GenAI API")
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
+from app.osm_recommend import OSMRecommender, get_http_client
+from llama_cpp import Llama
+import asyncio
+
+# Hugging Face repository and file of the quantized (Q4_K_M) GGUF chat model.
+# llama.cpp runs it with CPU kernels tuned for 4-bit weights, which is much
+# faster and lighter than the FP32 transformers checkpoint.
+MODEL_REPO = "Qwen/Qwen2-1.5B-Instruct-GGUF"
+MODEL_FILE = "qwen2-1_5b-instruct-q4_k_m.gguf"
+
+# System instructions sent at the start of every chat.
+# Keeping them identical across requests makes the formatted prompt share the same
+# token prefix, so llama.cpp reuses its KV cache for it instead of re-evaluating it.
+SYSTEM_PROMPT = (
+    "You are a restaurant recommendation assistant.\n"
+    "Rules:\n"
+    "- Do not use Markdown.\n"
+    "- Do not invent information.\n"
+    "- Use simple natural language.\n"
+    "- Only use the details given to you.\n"
+    "- Do not create details that are not given to you."
+)
+
+
+def load_llm():
+    """
+    Downloads (once, cached by huggingface_hub) and loads the GGUF model on CPU.
+    The chat template stored in the GGUF file is used to format the messages.
+    """
+    llm = Llama.from_pretrained(
+        repo_id=MODEL_REPO,
+        filename=MODEL_FILE,
+        n_ctx=2048,
+        n_threads=int(os.environ["OMP_NUM_THREADS"]),
+        n_threads_batch=int(os.environ["OMP_NUM_THREADS"]),
+        n_batch=512,
+        logits_all=False,
+        verbose=False
+    )
 
-# Expose the "static" directory so the frontend files can be served.
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+    # Warm up the model with a one-token generation.
+    # This pages the memory-mapped weights in and evaluates the system prompt once,
+    # so the first real request does not pay for it.
+    llm.create_chat_completion(
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": "Hello"}
+        ],
+        max_tokens=1
+    )
 
-# Load tokenizer for the Llama model.
-# The pad token is set to eos to avoid warnings and ensure consistent encoding.
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-tokenizer.pad_token = tokenizer.eos_token
+    return llm
+
+
+async def stream_response(llm, llm_lock, messages):
+    """
+    Runs a streaming chat completion on the shared model and yields the assistant
+    reply piece by piece as tokens are generated.
+    Each chunk is produced in a worker thread so the event loop is never blocked.
+    """
+    # The KV cache is allocated once with the model context and reused by every request.
+    # The lock is awaited on the event loop, so queued requests don't hold threadpool
+    # slots, and it is held until the whole reply has been generated.
+    async with llm_lock:
+        chunks = await run_in_threadpool(
+            llm.create_chat_completion,
+            messages=messages,
+            max_tokens=350,
+            temperature=0.3,
+            stream=True
+        )
+
+        try:
+            # Only the assistant reply is sent, without the prompt or special tokens
+            while True:
+                chunk = await run_in_threadpool(next, chunks, None)
+                if chunk is None:
+                    break
+
+                text = chunk["choices"][0]["delta"].get("content")
+                if text:
+                    yield text
+        finally:
+            # Stops generation if the client disconnects before the end of the reply
+            chunks.close()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models are built once per worker when the server starts, not at import time,
+    # and kept on app.state so they can be replaced (e.g. in tests).
+    app.state.llm = load_llm()
+
+    # A llama.cpp context is not thread-safe, so generations are serialized with a lock.
+    # It is created here, on the server's event loop, next to the model it guards.
+    app.state.llm_lock = asyncio.Lock()
+
+    # Instantiate the OSM-based restaurant recommender.
+    app.state.recommender = OSMRecommender()
+
+    yield
+
+    # Close the pooled Overpass connections on shutdown, and forget the closed client
+    # so a later startup in the same process creates a fresh one.
+    await get_http_client().aclose()
+    get_http_client.cache_clear()
 
-# Load the Llama model itself.
-# The pad token id must match the tokenizer so generation works correctly.
-model = AutoModelForCausalLM.from_pretrained(MODEL_NAME)
-model.config.pad_token_id = tokenizer.eos_token_id
 
-# Force model to run on CPU. 
-# This avoids GPU memory issues and keeps the service stable on machines without a large GPU.
-device = "cpu"
-model.eval()
+# Create the FastAPI application.
+# JSON responses are serialized with orjson, which is much faster than the stdlib json module.
+app = FastAPI(
+    title="Restaurant Recommender GenAI API",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
 
-# Instantiate the OSM-based restaurant recommender.
-recommender = OSMRecommender()
+# Expose the "static" directory so the frontend files can be served.
+app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 
 # Serve the index HTML page for the frontend.
@@ -44,18 +157,18 @@ def home():
 
 # Basic recommendation endpoint that only returns ranked restaurants.
 @app.get("/recommend")
-def recommend(query: str, user_lat: float, user_lon: float, radius: float = 100.0, k: int = 5):
-    results = recommender.recommend(query, user_lat, user_lon, radius, k)
+async def recommend(request: Request, query: str, user_lat: float, user_lon: float, radius: float = 100.0, k: int = 5):
+    results = await request.app.state.recommender.recommend(query, user_lat, user_lon, radius, k)
     return {"results": results}
 
 
-# Chat endpoint that sends recommendations through the Llama model.
+# Chat endpoint that sends recommendations through the LLM.
 @app.get("/chat")
-def recommend_llm(query: str, user_lat: float, user_lon: float, radius: float = 100.0, k: int = 20):
+async def recommend_llm(request: Request, query: str, user_lat: float, user_lon: float, radius: float = 100.0, k: int = 20):
 
-    results = recommender.recommend(query, user_lat, user_lon, radius, k)
+    results = await request.app.state.recommender.recommend(query, user_lat, user_lon, radius, k)
     if not results:
-        return {"response": "Sorry, I couldn't find any restaurants nearby."}
+        return PlainTextResponse("Sorry, I couldn't find any restaurants nearby.")
 
     # Build list of restaurants
     restaurant_list = "\n".join([
@@ -63,47 +176,23 @@ def recommend_llm(query: str, user_lat: float, user_lon: float, radius: float =
         for r in results
     ])
 
-    # Qwen-style structured chat prompt
-    prompt = f"""
-        <|im_start|>system
-        You are a restaurant recommendation assistant.
-        Rules:
-        - Do not use Markdown.
-        - Do not invent information.
-        - Use simple natural language.
-        - Only use the details given to you.
-        - Do not create details that are not given to you.
-        <|im_end|>
-
-        <|im_start|>user
-        I want food like: '{query}'.
-
-        Here are nearby restaurants:
-        {restaurant_list}
-
-        Select the best 3 options and explain why each was chosen.
-        Do not add details that are not included above.
-        <|im_end|>
-
-        <|im_start|>assistant
-        """
-
-    inputs = tokenizer(prompt, return_tensors="pt").to(device)
-
-    outputs = model.generate(
-        **inputs,
-        max_new_tokens=350,
-        temperature=0.3,
-        do_sample=True
+    # Structured chat messages, formatted by the model's own chat template
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": (
+                f"I want food like: '{query}'.\n\n"
+                f"Here are nearby restaurants:\n"
+                f"{restaurant_list}\n\n"
+                "Select the best 3 options and explain why each was chosen.\n"
+                "Do not add details that are not included above."
+            )
+        }
+    ]
+
+    # Tokens are sent as soon as they are generated, so the user sees the answer start right away.
+    return StreamingResponse(
+        stream_response(request.app.state.llm, request.app.state.llm_lock, messages),
+        media_type="text/plain"
     )
-
-    response_text = tokenizer.decode(outputs[0], skip_special_tokens=False)
-
-    # Extract only the final assistant response
-    if "<|im_start|>assistant" in response_text:
-        response_text = response_text.split("<|im_start|>assistant")[-1].strip()
-
-    if "<|im_end|>" in response_text:
-        response_text = response_text.split("<|im_end|>")[0].strip()
-
-    return {"response": response_text}
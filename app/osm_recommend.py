@@ -1,11 +1,28 @@
 # app/osm_recommend.py
 
-import requests
-import faiss
+import os
+import asyncio
+import httpx
 import numpy as np
-from math import radians, cos, sin, asin, sqrt
+import onnxruntime as ort
+from cachetools import TTLCache
+from functools import lru_cache
+from fastapi.concurrency import run_in_threadpool
 from sentence_transformers import SentenceTransformer
 
+# Embedding model and its dynamically quantized INT8 ONNX export (published in the model repo).
+# It runs on ONNX Runtime's CPU provider, roughly twice as fast as the FP32 PyTorch model.
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_ONNX_FILE = "onnx/model_quint8_avx2.onnx"
+
+# Decimals the user coordinates are rounded to for the candidate cache (~110 m cells).
+CACHE_DECIMALS = 3
+
+# Extra search radius in meters around a cache cell centre. A user can be up to half a
+# cell away on both axes (~79 m at the equator), so padding the radius by this much
+# makes the fetched circle cover the search area of every user in the cell.
+CACHE_RADIUS_PADDING = 80
+
 # URL for Overpass API. This is the service used to query OpenStreetMap data.
 OVERPASS_URL = "http://overpass-api.de/api/interpreter"
 
@@ -24,14 +41,45 @@ out center;
 """
 
 
+@lru_cache
+def get_http_client():
+    """
+    Returns the shared async HTTP client used to talk to Overpass.
+    Created once and reused so connections are pooled across requests.
+    """
+    return httpx.AsyncClient(timeout=25)
+
+
 class OSMRecommender:
     def __init__(self):
         # Load the embedding model used to convert restaurant descriptions into vectors.
         # This model is small and fast, suitable for CPU inference.
         print("Loading embedding model...")
-        self.model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
 
-    def __fetch_osm_restaurants(self, lat, lon, radius=1000):
+        # ONNX Runtime keeps its own thread pool, so it is capped to the same
+        # per-worker thread count as the other CPU libraries.
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = int(os.environ.get("OMP_NUM_THREADS", 0))
+        session_options.inter_op_num_threads = 1
+
+        self.model = SentenceTransformer(
+            EMBEDDING_MODEL,
+            backend="onnx",
+            model_kwargs={
+                "file_name": EMBEDDING_ONNX_FILE,
+                "provider": "CPUExecutionProvider",
+                "session_options": session_options
+            }
+        )
+
+        # Nearby OSM data rarely changes within minutes, so the fetched restaurants and
+        # their embeddings are cached per rounded location (~100 m) and radius.
+        self.cache = TTLCache(maxsize=512, ttl=300)
+
+        # Loads in progress per cache key, so concurrent misses share one Overpass request.
+        self.pending = {}
+
+    async def __fetch_osm_restaurants(self, lat, lon, radius=1000):
         """
         Calls the Overpass API and retrieves food-related amenities near a location.
         Returns a list of normalized restaurant dictionaries.
@@ -40,7 +88,8 @@ class OSMRecommender:
 
         try:
             # Overpass only accepts POST requests for large queries.
-            response = requests.post(url=OVERPASS_URL, data=query, timeout=25)
+            # The request is awaited so the event loop keeps serving other requests meanwhile.
+            response = await get_http_client().post(OVERPASS_URL, content=query)
 
             # The API should return HTTP 200. Anything else is an error.
             if response.status_code != 200:
@@ -64,7 +113,7 @@ class OSMRecommender:
             restaurants = [self.__normalize_osm(r) for r in data["elements"]]
             return [r for r in restaurants if r is not None]
 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             print("Overpass API timeout")
             return []
 
@@ -114,75 +163,137 @@ class OSMRecommender:
 
     def __haversine(self, lat1, lon1, lat2, lon2):
         """
-        Computes the distance between two coordinates using the Haversine formula.
+        Computes the distance between coordinates using the Haversine formula.
+        Accepts NumPy arrays so all candidates are handled in a single vectorized pass.
         Returns distance in kilometers.
         """
         R = 6371  # Earth radius in km
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
+        dlat = np.radians(lat2 - lat1)
+        dlon = np.radians(lon2 - lon1)
 
         a = (
-            sin(dlat / 2) ** 2
-            + cos(radians(lat1))
-            * cos(radians(lat2))
-            * sin(dlon / 2) ** 2
+            np.sin(dlat / 2) ** 2
+            + np.cos(np.radians(lat1))
+            * np.cos(np.radians(lat2))
+            * np.sin(dlon / 2) ** 2
         )
-        c = 2 * asin(sqrt(a))
+        c = 2 * np.arcsin(np.sqrt(a))
         return R * c
 
-    def recommend(self, user_query, user_lat, user_lon, radius=1000, k=20):
+    async def recommend(self, user_query, user_lat, user_lon, radius=1000, k=20):
         """
         End-to-end pipeline:
-        1. Query OSM for nearby restaurants.
-        2. Convert each restaurant into an embedding.
+        1. Query OSM for nearby restaurants (cached per location).
+        2. Convert each restaurant into an embedding (cached per location).
         3. Embed the user query.
-        4. Compute similarity using FAISS.
+        4. Compute cosine similarity against the restaurant embeddings.
         5. Combine similarity and physical distance into a final score.
         6. Return the top-k results.
         """
-        restaurants = self.__fetch_osm_restaurants(user_lat, user_lon, radius)
+        cache_key = (round(user_lat, CACHE_DECIMALS), round(user_lon, CACHE_DECIMALS), radius)
+        candidates = self.cache.get(cache_key)
+
+        if candidates is None:
+            task = self.pending.get(cache_key)
+            if task is None:
+                task = asyncio.ensure_future(self.__load_candidates(cache_key))
+                self.pending[cache_key] = task
+                task.add_done_callback(lambda _: self.pending.pop(cache_key, None))
+
+            # Shielded so a disconnecting client doesn't cancel a load other requests await.
+            candidates = await asyncio.shield(task)
+            if candidates is None:
+                return []
+
+        # Ranking is CPU-bound, so it runs in a worker thread to keep the event loop responsive.
+        return await run_in_threadpool(
+            self.__rank, candidates, user_query, user_lat, user_lon, radius, k
+        )
+
+    async def __load_candidates(self, cache_key):
+        """
+        Fetches and embeds the restaurants of a cache cell and stores them in the cache.
+        The search is centred on the cell, not on a particular user, so the cached
+        candidates are the same whichever user of the cell triggered the load.
+        Returns None when no restaurant was found (failures are not cached).
+        """
+        lat, lon, radius = cache_key
+        restaurants = await self.__fetch_osm_restaurants(lat, lon, radius + CACHE_RADIUS_PADDING)
         if not restaurants:
-            return []
+            return None
+
+        # Embedding is CPU-bound, so it runs in a worker thread.
+        candidates = await run_in_threadpool(self.__embed_restaurants, restaurants)
+        self.cache[cache_key] = candidates
+        return candidates
 
+    def __embed_restaurants(self, restaurants):
+        """
+        Encodes the restaurant descriptions into unit-length vectors.
+        Returns the restaurants with their embeddings and coordinate arrays.
+        """
         # Build text descriptions for embedding.
         descriptions = [self.__build_description(r) for r in restaurants]
 
-        # Encode descriptions into vectors.
-        embeddings = self.model.encode(descriptions, convert_to_tensor=False)
-        embeddings = np.array(embeddings).astype("float32")
+        # Keep coordinates as arrays for vectorized distance computation.
+        lats = np.array([r["lat"] for r in restaurants], dtype=np.float32)
+        lons = np.array([r["lon"] for r in restaurants], dtype=np.float32)
 
-        # Normalize vectors to unit length for dot-product similarity.
-        faiss.normalize_L2(embeddings)
+        # Encode descriptions into vectors normalized to unit length for dot-product similarity.
+        embeddings = self.model.encode(
+            descriptions,
+            batch_size=64,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        ).astype("float32")
 
-        # Create FAISS index for inner-product search.
-        index = faiss.IndexFlatIP(embeddings.shape[1])
-        index.add(embeddings)
+        return restaurants, embeddings, lats, lons
 
-        # Encode the user query.
-        query_emb = self.model.encode(user_query, convert_to_tensor=False)
-        query_emb = np.array(query_emb).astype("float32")
-        faiss.normalize_L2(query_emb.reshape(1, -1))
+    def __rank(self, candidates, user_query, user_lat, user_lon, radius, k):
+        """
+        Embeds the user query, then ranks the candidate restaurants
+        by a combination of semantic similarity and physical distance.
+        """
+        restaurants, embeddings, lats, lons = candidates
+
+        # The candidates cover the whole cache cell, so keep only those within
+        # the radius (in meters) of this user.
+        dist_km = self.__haversine(user_lat, user_lon, lats, lons)
+        in_range = np.flatnonzero(dist_km <= radius / 1000)
+        if len(in_range) == 0:
+            return []
+
+        # Encode the user query directly into a unit-length NumPy vector.
+        query_emb = self.model.encode(
+            user_query, convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32, copy=False)
 
         # Perform similarity search.
-        distances, indices = index.search(query_emb.reshape(1, -1), k)
+        # With only a few hundred candidates, a direct dot product plus a partial sort
+        # is cheaper than building a FAISS index for every request.
+        sims = embeddings[in_range] @ query_emb
+        top_k = min(k, len(sims))
+        top = np.argpartition(-sims, top_k - 1)[:top_k]
+        top = top[np.argsort(-sims[top])]
 
-        ranked = []
-        for idx, sim in zip(indices[0], distances[0]):
-            r = restaurants[idx]
+        indices = in_range[top]
+        top_sims = sims[top]
 
-            # Compute real-world distance from user.
-            dist_km = self.__haversine(user_lat, user_lon, r["lat"], r["lon"])
+        # Real-world distance from user for all selected candidates.
+        top_dist_km = dist_km[indices]
 
-            # Convert radius from meters to kilometers when scoring.
-            dist_score = max(0, 1 - dist_km / (radius / 1000))
+        # Convert radius from meters to kilometers when scoring.
+        dist_score = np.maximum(0, 1 - top_dist_km / (radius / 1000))
 
-            # Weighted combination of semantic similarity and physical closeness.
-            final_score = (0.6 * float(sim)) + (0.4 * dist_score)
+        # Weighted combination of semantic similarity and physical closeness.
+        final_scores = (0.6 * top_sims) + (0.4 * dist_score)
 
-            r_out = r.copy()
-            r_out["similarity"] = float(sim)
-            r_out["distance_km"] = dist_km
-            r_out["final_score"] = final_score
+        ranked = []
+        for idx, sim, dist, final_score in zip(indices, top_sims, top_dist_km, final_scores):
+            r_out = restaurants[idx].copy()
+            r_out["similarity"] = round(float(sim), 3)
+            r_out["distance_km"] = round(float(dist), 3)
+            r_out["final_score"] = round(float(final_score), 3)
 
             ranked.append(r_out)
 
@@ -48,15 +48,41 @@ async function sendChat() {
         `/chat?query=${encodeURIComponent(query)}&user_lat=${lat}&user_lon=${lon}&radius=20000`
     );
 
-    const data = await res.json();
+    // REPLACE LOADING WITH AN AI MESSAGE (ONCE)
+    let botDiv = null;
+    const showBotMessage = () => {
+        if (!botDiv) {
+            loadingDiv.remove();
+            botDiv = document.createElement("div");
+            botDiv.className = "chat-message chat-bot";
+            chatLog.appendChild(botDiv);
+        }
+        return botDiv;
+    };
+
+    // ERROR RESPONSES ARE NOT SHOWN AS AN ANSWER
+    if (!res.ok) {
+        showBotMessage().textContent = "Sorry, something went wrong. Please try again.";
+        chatLog.scrollTop = chatLog.scrollHeight;
+        return;
+    }
 
-    // REMOVE LOADING AND REPLACE WITH AI ANSWER
-    loadingDiv.remove();
+    // THE ANSWER IS STREAMED AS PLAIN TEXT WHILE IT IS GENERATED
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let text = "";
 
-    const botDiv = document.createElement("div");
-    botDiv.className = "chat-message chat-bot";
-    botDiv.textContent = data.response;
-    chatLog.appendChild(botDiv);
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
 
+        text += decoder.decode(value, { stream: true });
+        showBotMessage().textContent = text.trim();
+        chatLog.scrollTop = chatLog.scrollHeight;
+    }
+
+    // FLUSH ANY BYTES LEFT IN THE DECODER
+    text += decoder.decode();
+    showBotMessage().textContent = text.trim();
     chatLog.scrollTop = chatLog.scrollHeight;
-}
+}
\ No newline at end of file
@@ -1,12 +1,15 @@
 # app/recommend.py
-import json
+import orjson
 import faiss
 import numpy as np
-from math import radians, cos, sin, asin, sqrt
 from sentence_transformers import SentenceTransformer
 
 PROCESSED_PATH = "app/data/processed.json"
-FAISS_INDEX = faiss.read_index("app/data/faiss.index")
+COORDS_PATH = "app/data/coords.npy"
+# Opened read-only with memory-mapping. faiss only memory-maps the inverted lists of IVF
+# indexes, so workers share pages through the OS cache once preprocess builds an IVFPQ
+# index; a flat index (the bundled dataset) is still read into each process.
+FAISS_INDEX = faiss.read_index("app/data/faiss.index", faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
 
 
 class DatabaseRestaurantRecommender:
@@ -15,35 +18,32 @@ class DatabaseRestaurantRecommender:
         self.model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
 
         print("Loading processed dataset...")
-        with open(PROCESSED_PATH) as f:
-            self.db = json.load(f)
+        with open(PROCESSED_PATH, "rb") as f:
+            self.db = orjson.loads(f.read())
 
-    def recommend(self, query, user_lat, user_lon, k=3):        
-        # Encode user query
-        query_emb = self.model.encode(query, convert_to_numpy=True).astype("float32")
+        # Latitude/longitude of every restaurant as a float32 array, same order as the dataset
+        self.coords = np.load(COORDS_PATH)
 
-        # Normalize for cosine similarity
-        faiss.normalize_L2(query_emb.reshape(1, -1))
+    def recommend(self, query, user_lat, user_lon, k=3):        
+        # Encode user query, normalized for cosine similarity
+        query_emb = self.model.encode(
+            query, convert_to_numpy=True, normalize_embeddings=True
+        ).astype(np.float32, copy=False)
 
         # FAISS search
-        distances, indices = FAISS_INDEX.search(query_emb.reshape(1, -1), k)
+        distances, indices = FAISS_INDEX.search(query_emb[None, :], k)
 
-        results = []
-        for i, sim in zip(indices[0], distances[0]):
-            r = self.db[i]
+        # Distances for all candidates at once
+        coords = self.coords[indices[0]]
+        distances_km = self.__haversine(user_lat, user_lon, coords[:, 0], coords[:, 1])
 
-            # Get restaurant location (safe)
-            lat = float(r.get("Latitude", 999))
-            lon = float(r.get("Longitude", 999))
+        # Normalize distance: 0–100 km range
+        max_dist = 100
+        distance_scores = np.maximum(0, 1 - (distances_km / max_dist))
 
-            if lat == 999 or lon == 999:
-                distance_km = 9999
-            else:
-                distance_km = self.__haversine(user_lat, user_lon, lat, lon)
-
-            # Normalize distance: 0–100 km range
-            max_dist = 100
-            distance_score = max(0, 1 - (distance_km / max_dist))
+        results = []
+        for i, sim, distance_km, distance_score in zip(indices[0], distances[0], distances_km, distance_scores):
+            r = self.db[i]
 
             # Rating score
             rating = float(r.get("Aggregate rating", 0))
@@ -60,7 +60,7 @@ class DatabaseRestaurantRecommender:
             r_out["similarity"] = float(sim)
             r_out["distance_km"] = float(distance_km)
             r_out["rating_score"] = rating_score
-            r_out["distance_score"] = distance_score
+            r_out["distance_score"] = float(distance_score)
             r_out["final_score"] = float(final_score)
 
             results.append(r_out)
@@ -72,9 +72,9 @@ class DatabaseRestaurantRecommender:
     
     def __haversine(self, lat1, lon1, lat2, lon2):
         R = 6371 
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
+        dlat = np.radians(lat2 - lat1)
+        dlon = np.radians(lon2 - lon1)
 
-        a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a))
+        a = np.sin(dlat/2)**2 + np.cos(np.radians(lat1)) * np.cos(np.radians(lat2)) * np.sin(dlon/2)**2
+        c = 2 * np.arcsin(np.sqrt(a))
         return R * c
@@ -3,13 +3,17 @@ import pandas as pd
 import json
 import torch
 from sentence_transformers import SentenceTransformer
-from text_cleaning import clean_text
+from text_cleaning import clean_text_series
 import faiss
 import numpy as np
 
 DATA_PATH = "app/data/restaurants.csv"
 PROCESSED_PATH = "app/data/processed.json"
 EMB_PATH = "app/data/embeddings.pt"
+COORDS_PATH = "app/data/coords.npy"
+
+# Minimum corpus size to use an IVFPQ index (PQ with 8 bits needs ~39 * 256 training vectors)
+IVFPQ_MIN_VECTORS = 10000
     
 def remove_replacement_chars(text):
     if not isinstance(text, str):
@@ -50,17 +54,19 @@ def preprocess():
     df = df.dropna(subset=["Latitude", "Longitude"])
 
     print("Cleaning text...")
-    df["clean_cuisines"] = df["Cuisines"].apply(clean_text)
-    df["clean_rating_text"] = df["Rating text"].apply(clean_text)
+    df["clean_cuisines"] = clean_text_series(df["Cuisines"])
+    df["clean_rating_text"] = clean_text_series(df["Rating text"])
 
     print("Building semantic descriptions...")
-    df["description"] = df.apply(lambda row: (
-        f"{row['Restaurant Name']} in {row['City']}. "
-        f"Cuisines: {row['clean_cuisines']}. "
-        f"Average cost for two: {row['Average Cost for two']} ({row['Price range']}/5 price level). "
-        f"Rating: {row['Aggregate rating']} ({row['clean_rating_text']}) with {row['Votes']} votes. "
-        f"Address: {row['Address']}."
-    ), axis=1)
+    df["description"] = (
+        df["Restaurant Name"].astype(str) + " in " + df["City"].astype(str) + ". "
+        + "Cuisines: " + df["clean_cuisines"] + ". "
+        + "Average cost for two: " + df["Average Cost for two"].astype(str)
+        + " (" + df["Price range"].astype(str) + "/5 price level). "
+        + "Rating: " + df["Aggregate rating"].astype(str)
+        + " (" + df["clean_rating_text"] + ") with " + df["Votes"].astype(str) + " votes. "
+        + "Address: " + df["Address"].astype(str) + "."
+    )
 
     print("Converting to records...")
     records = df.to_dict(orient="records")
@@ -71,13 +77,25 @@ def preprocess():
     # Convert to numpy float32
     embeddings_np = embeddings.cpu().numpy().astype("float32")
 
-    # Create FAISS index
-    dim = embeddings_np.shape[1]
-    index = faiss.IndexFlatIP(dim) # cosine similarity (via inner product with normalized vectors)
-
     # Normalize embeddings for cosine similarity
     faiss.normalize_L2(embeddings_np)
 
+    # Create FAISS index
+    dim = embeddings_np.shape[1]
+    n_vectors = embeddings_np.shape[0]
+    if n_vectors >= IVFPQ_MIN_VECTORS:
+        # Large corpus: inverted lists + product quantization, so a search only scans
+        # nprobe lists of compressed codes instead of every full vector
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(
+            quantizer, dim, min(256, n_vectors // 40), 32, 8, faiss.METRIC_INNER_PRODUCT
+        )
+        index.train(embeddings_np)
+        index.nprobe = 16
+    else:
+        # Small corpus: exact search is already fast and PQ would not have enough training data
+        index = faiss.IndexFlatIP(dim) # cosine similarity (via inner product with normalized vectors)
+
     # Add to index
     index.add(embeddings_np)
 
@@ -86,9 +104,13 @@ def preprocess():
 
     torch.save(embeddings, EMB_PATH)
 
+    # Save coordinates as a contiguous float32 array (same row order as the records)
+    np.save(COORDS_PATH, df[["Latitude", "Longitude"]].to_numpy(dtype=np.float32))
+
     with open(PROCESSED_PATH, "w") as f:
         json.dump(records, f, indent=4)
 
     print("Preprocessing completed!")
 
-preprocess()
+if __name__ == "__main__":
+    preprocess()
@@ -1,7 +1,17 @@
 import re
 
+NON_ALLOWED_PATTERN = re.compile(r"[^a-z0-9áéíóúãõç ]+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
 def clean_text(text: str):
-    text = text.lower()
-    text = re.sub(r"[^a-z0-9áéíóúãõç ]", " ", text)
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
\ No newline at end of file
+    text = NON_ALLOWED_PATTERN.sub(" ", text.lower())
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+def clean_text_series(series):
+    # Same as clean_text, but runs on a whole pandas Series with vectorized string ops
+    return (
+        series.str.lower()
+        .str.replace(NON_ALLOWED_PATTERN, " ", regex=True)
+        .str.replace(WHITESPACE_PATTERN, " ", regex=True)
+        .str.strip()
+    )
\ No newline at end of file